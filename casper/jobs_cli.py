@@ -1,11 +1,27 @@
+import json
+from datetime import datetime, timedelta
+import re
+import time
+from collections import OrderedDict, deque
+
 import click
+import pytz
 import yaml
 from click import ClickException
 from tabulate import tabulate
 
 from casper.main import cli, context
 from pyghost.api_client import ApiClientException, JobCommands, JobStatuses
-from .utils import regex_validate
+from .utils import StreamingQuantile, parse_log_line_date, parse_rfc1123_date, regex_validate
+
+STATS_QUANTILES = (0.5, 0.95, 0.99)
+
+LOG_MAX_RECONNECTS = 5
+LOG_RECONNECT_DELAY = 2
+# Allowed clock difference between Ghost and casper when telling existing log lines from live ones
+LOG_CLOCK_TOLERANCE = timedelta(seconds=30)
+# Ghost log lines start with their date, possibly preceded by ANSI color codes
+LOG_LINE_DATE_REGEX = re.compile(rb'^(?:\x1b\[[0-9;]*m)*(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) GMT')
 
 
 @cli.group('job', help="Manage jobs")
@@ -44,6 +60,104 @@ def jobs_list(context, nb, page, application, env, role, command, status, user):
     ))
 
 
+@jobs.command('stats', short_help="Show statistics on the jobs history",
+              help="Compute counts, failure rates and duration percentiles per application and command "
+                   "over all the jobs matching the filters")
+@click.option('--nb', default=100, help="Number of jobs to fetch per page (default 100)")
+@click.option('--application', help="Filter list by application name (regex usage possible)")
+@click.option('--env', help="Filter by application environment", callback=regex_validate('^[a-z0-9\-_]*$'))
+@click.option('--role', help="Filter by application role", callback=regex_validate('^[a-z0-9\-_]*$'))
+@click.option('--command', help="Filter by job command", type=click.Choice(list(map(str, JobCommands))))
+@click.option('--status', help="Filter by job status", type=click.Choice(list(map(str, JobStatuses))))
+@click.option('--user', help="Filter by job user")
+@click.option('--since', type=click.DateTime(), help="Only consider jobs created after this date (UTC)")
+@click.option('--until', type=click.DateTime(), help="Only consider jobs created before this date (UTC)")
+@click.option('--format', type=click.Choice(['table', 'json']), default='table',
+              help="Output format")
+@context
+def jobs_stats(context, nb, application, env, role, command, status, user, since, until, format):
+    since = pytz.UTC.localize(since) if since else None
+    until = pytz.UTC.localize(until) if until else None
+
+    stats = {}
+    # Newest jobs first: everything after the first job older than `since` is outside the window
+    for job in iter_jobs(context, nb=nb, sort='-_created', application=application, env=env, role=role,
+                         command=command, status=status, user=user):
+        created = parse_rfc1123_date(job['_created'])
+        if since and created < since:
+            break
+        if until and created > until:
+            continue
+        app_name = job['app_id']['name'] if job.get('app_id') else ''
+        key = (app_name, job['command'])
+        if key not in stats:
+            stats[key] = JobStats()
+        stats[key].add(job, created)
+
+    rows = [[app_name, job_command] + job_stats.summary()
+            for (app_name, job_command), job_stats in sorted(stats.items())]
+    headers = ['Application name', 'Command', 'Jobs', 'Done', 'Failed', 'Failure rate'] + \
+              ['Duration p{} (s)'.format(int(q * 100)) for q in STATS_QUANTILES]
+
+    if format == 'json':
+        keys = ['application', 'command', 'jobs', 'done', 'failed', 'failure_rate'] + \
+               ['duration_p{}_seconds'.format(int(q * 100)) for q in STATS_QUANTILES]
+        click.echo(json.dumps([OrderedDict(zip(keys, row)) for row in rows], indent=4))
+    else:
+        click.echo(tabulate(rows, headers=headers, floatfmt='.2f'))
+
+
+def iter_jobs(context, nb, **filters):
+    """
+    Yield every job matching filters, fetching them page by page
+    """
+    page = 1
+    while True:
+        try:
+            job_list, max_results, total, cur_page = context.jobs.list(nb=nb, page=page, **filters)
+        except ApiClientException as e:
+            raise ClickException(e) from e
+
+        for job in job_list:
+            yield job
+
+        # The API may serve fewer jobs per page than requested
+        if not job_list or page * max_results >= total:
+            return
+        page += 1
+
+
+class JobStats:
+    """
+    Aggregates jobs in constant memory: durations, in seconds, are only kept through a quantile sketch
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.done = 0
+        self.failed = 0
+        self.durations = StreamingQuantile(STATS_QUANTILES)
+
+    def add(self, job, created):
+        self.count += 1
+        if job['status'] == 'done':
+            self.done += 1
+        elif job['status'] == 'failed':
+            self.failed += 1
+        else:
+            return
+
+        duration = (parse_rfc1123_date(job['_updated']) - created).total_seconds()
+        self.durations.add(duration)
+
+    def summary(self):
+        finished = self.done + self.failed
+        return [
+            self.count, self.done, self.failed,
+            self.failed / finished if finished else None,
+        ] + [self.durations.value(q) for q in STATS_QUANTILES]
+
+
 @jobs.command('show', short_help="Show the details of a job")
 @click.argument('job-id')
 @context
@@ -61,21 +175,120 @@ def job_show(context, job_id):
 @click.option('--output', help="Path of output log file", type=click.File('w'))
 @click.option('--no-color', help="Remove ANSI color from output", is_flag=True)
 @click.option('--waitstart', help="Wait for job to start if applicable", is_flag=True)
+@click.option('--tail', type=click.IntRange(min=0),
+              help="Only show the last TAIL lines of the existing log before following")
+@click.option('--since', type=click.DateTime(), help="Only show log lines written after this date (UTC)")
+@click.option('--max-reconnects', default=LOG_MAX_RECONNECTS, type=click.IntRange(min=0),
+              help="Number of times to resume the log stream if the connection drops "
+                   "(default {})".format(LOG_MAX_RECONNECTS))
 @context
-def job_log(context, job_id, output, no_color, waitstart):
-    job_log_handler(context, job_id, output, no_color, waitstart)
+def job_log(context, job_id, output, no_color, waitstart, tail, since, max_reconnects):
+    job_log_handler(context, job_id, output, no_color, waitstart,
+                    tail=tail, since=pytz.UTC.localize(since) if since else None, max_reconnects=max_reconnects)
 
 
-def job_log_handler(context, job_id, output, no_color, waitstart):
-    def success_handler(log):
-        click.echo(log, nl=False)
-        if output is not None:
-            output.write(log.decode('utf-8'))
+def job_log_handler(context, job_id, output, no_color, waitstart, tail=None, since=None,
+                    max_reconnects=LOG_MAX_RECONNECTS):
+    stream = JobLogStream(output, tail=tail, since=since, attached_at=datetime.now(pytz.UTC))
 
     def exception_handler(ex):
-        raise ClickException('Error while retrieving logs: {}'.format(ex)) from ex
+        raise LogStreamInterrupted(ex) from ex
 
-    try:
-        context.jobs.get_logs_async(job_id, success_handler, exception_handler, wait_for_start=waitstart, no_color=no_color)
-    except ApiClientException as e:
-        raise ClickException('Error while retrieving logs: {}'.format(e)) from e
+    reconnects = 0
+    while True:
+        resume_offset = stream.offset
+        stream.connect()
+        try:
+            context.jobs.get_logs_async(job_id, stream.feed, exception_handler,
+                                        wait_for_start=waitstart, no_color=no_color)
+            break
+        except ApiClientException as e:
+            raise ClickException('Error while retrieving logs: {}'.format(e)) from e
+        except LogStreamInterrupted as e:
+            # Nothing received yet without waiting for the job to start: the job log is not reachable
+            if not stream.offset and not waitstart:
+                raise ClickException('Error while retrieving logs: {}'.format(e.__cause__)) from e
+            if stream.offset > resume_offset:
+                reconnects = 0
+            if reconnects >= max_reconnects:
+                raise ClickException('Error while retrieving logs: {}'.format(e.__cause__)) from e
+            reconnects += 1
+            click.echo(click.style('Log stream interrupted ({}), resuming after {} bytes...'.format(
+                e.__cause__, stream.offset), fg='yellow'), err=True)
+            time.sleep(LOG_RECONNECT_DELAY * reconnects)
+    stream.close()
+
+
+class LogStreamInterrupted(Exception):
+    pass
+
+
+class JobLogStream:
+    """
+    Writes a job log received through one or several connections, skipping what was already received
+    and optionally keeping only the lines written after `since` and the last `tail` lines of the existing log.
+    The existing log ends with the first line dated after `attached_at`, or with the stream for a finished job.
+    """
+
+    def __init__(self, output, tail=None, since=None, attached_at=None):
+        self.output = output
+        self.offset = 0
+        self._connection_offset = 0
+        self._since = since
+        self._tail = deque(maxlen=tail) if tail is not None else None
+        self._live_since = attached_at - LOG_CLOCK_TOLERANCE if attached_at else None
+        self._partial_line = b''
+
+    def connect(self):
+        self._connection_offset = 0
+
+    def feed(self, log):
+        # A resumed connection replays the log from the start: drop the bytes already received
+        start = self._connection_offset
+        self._connection_offset += len(log)
+        if self._connection_offset <= self.offset:
+            return
+        log = log[max(0, self.offset - start):]
+        self.offset = self._connection_offset
+
+        if self._since is None and self._tail is None:
+            self._write(self._partial_line + log)
+            self._partial_line = b''
+            return
+
+        lines = (self._partial_line + log).splitlines(keepends=True)
+        self._partial_line = lines.pop() if lines and not lines[-1].endswith(b'\n') else b''
+        for line in lines:
+            self._feed_line(line)
+
+    def close(self):
+        if self._partial_line:
+            self._feed_line(self._partial_line)
+            self._partial_line = b''
+        self._flush_tail()
+
+    def _feed_line(self, line):
+        match = LOG_LINE_DATE_REGEX.match(line)
+        date = parse_log_line_date(match.group(1)) if match else None
+        if self._since is not None:
+            if date is None or date < self._since:
+                return
+            self._since = None
+        if self._tail is not None and date is not None and self._live_since is not None and date >= self._live_since:
+            self._flush_tail()
+        if self._tail is not None:
+            self._tail.append(line)
+        else:
+            self._write(line)
+
+    def _flush_tail(self):
+        if self._tail is not None:
+            self._write(b''.join(self._tail))
+            self._tail = None
+
+    def _write(self, log):
+        if not log:
+            return
+        click.echo(log, nl=False)
+        if self.output is not None:
+            self.output.write(log.decode('utf-8'))
@@ -1,8 +1,14 @@
+import bisect
+import math
 import re
+from datetime import datetime
 
+import pytz
 from click import BadParameter
 
 RFC1123_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+LOG_LINE_DATE_FORMAT = '%Y/%m/%d %H:%M:%S'
+STREAMING_QUANTILE_EXACT_SIZE = 500
 
 
 def regex_validate(pattern):
@@ -13,3 +19,94 @@ def regex_validate(pattern):
         return value
 
     return validate
+
+
+def parse_rfc1123_date(value):
+    return datetime.strptime(value, RFC1123_DATE_FORMAT).replace(tzinfo=pytz.UTC)
+
+
+def parse_log_line_date(value):
+    return datetime.strptime(value.decode('ascii'), LOG_LINE_DATE_FORMAT).replace(tzinfo=pytz.UTC)
+
+
+class StreamingQuantile:
+    """
+    Estimates several quantiles of a stream in constant memory.
+    The first `exact_size` observations are kept sorted and give the exact nearest-rank quantiles, then they seed,
+    for each quantile, the five markers of the P-square algorithm (Jain & Chlamtac, 1985) which takes over.
+    """
+
+    def __init__(self, quantiles, exact_size=STREAMING_QUANTILE_EXACT_SIZE):
+        self.quantiles = tuple(quantiles)
+        self.exact_size = max(exact_size, 5)
+        self.count = 0
+        self._sample = []
+        self._markers = None
+
+    def add(self, value):
+        self.count += 1
+        if self._markers is None:
+            bisect.insort(self._sample, value)
+            if self.count > self.exact_size:
+                self._markers = {q: PSquareMarkers(q, self._sample) for q in self.quantiles}
+                self._sample = None
+            return
+
+        for markers in self._markers.values():
+            markers.add(value)
+
+    def value(self, quantile):
+        if not self.count:
+            return None
+        if self._markers is None:
+            return self._sample[max(math.ceil(quantile * self.count) - 1, 0)]
+        return self._markers[quantile].heights[2]
+
+
+class PSquareMarkers:
+    """
+    The five markers of the P-square algorithm estimating `quantile`, seeded from a sorted sample
+    """
+
+    def __init__(self, quantile, sample):
+        n = len(sample)
+        self._increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+        self._desired = [1 + (n - 1) * increment for increment in self._increments]
+        self._positions = [1, 0, 0, 0, n]
+        for i in range(1, 4):
+            # Marker positions must stay strictly increasing
+            self._positions[i] = min(max(int(round(self._desired[i])), self._positions[i - 1] + 1), n - 4 + i)
+        self.heights = [sample[position - 1] for position in self._positions]
+
+    def add(self, value):
+        heights, positions = self.heights, self._positions
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if heights[i] <= value < heights[i + 1])
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in range(1, 4):
+            delta = self._desired[i] - positions[i]
+            if (delta >= 1 and positions[i + 1] - positions[i] > 1) or \
+                    (delta <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if delta > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        q, n = self.heights, self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
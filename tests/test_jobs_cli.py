@@ -0,0 +1,171 @@
+from datetime import datetime
+from unittest.mock import Mock
+
+import pytest
+import pytz
+from click import ClickException
+
+from casper import jobs_cli
+from casper.jobs_cli import JobLogStream, JobStats, iter_jobs
+from casper.utils import parse_rfc1123_date
+from pyghost.api_client import ApiClientException
+
+
+def make_job(status, created, updated):
+    return {'status': status, '_created': created, '_updated': updated}
+
+
+def test_job_stats():
+    stats = JobStats()
+    jobs = [
+        make_job('done', 'Mon, 01 Jan 2018 10:00:00 GMT', 'Mon, 01 Jan 2018 10:01:00 GMT'),
+        make_job('done', 'Mon, 01 Jan 2018 11:00:00 GMT', 'Mon, 01 Jan 2018 11:02:00 GMT'),
+        make_job('failed', 'Mon, 01 Jan 2018 12:00:00 GMT', 'Mon, 01 Jan 2018 12:10:00 GMT'),
+        make_job('started', 'Mon, 01 Jan 2018 13:00:00 GMT', 'Mon, 01 Jan 2018 13:00:00 GMT'),
+    ]
+    for job in jobs:
+        stats.add(job, parse_rfc1123_date(job['_created']))
+
+    assert stats.summary() == [4, 2, 1, 1 / 3, 120, 600, 600]
+
+
+def test_job_stats_without_finished_jobs():
+    stats = JobStats()
+    job = make_job('started', 'Mon, 01 Jan 2018 13:00:00 GMT', 'Mon, 01 Jan 2018 13:00:00 GMT')
+    stats.add(job, parse_rfc1123_date(job['_created']))
+
+    assert stats.summary() == [1, 0, 0, None, None, None, None]
+
+
+class FakeOutput:
+    def __init__(self):
+        self.content = ''
+
+    def write(self, data):
+        self.content += data
+
+
+LOG = b''.join(b'\x1b[32m2018/01/01 10:%02d:00 GMT: step %d\x1b[0m\nscript output %d\n' % (i, i, i)
+               for i in range(10))
+
+
+def stream_log(stream, chunks):
+    stream.connect()
+    for chunk in chunks:
+        stream.feed(chunk)
+
+
+def test_job_log_stream_passthrough():
+    output = FakeOutput()
+    stream = JobLogStream(output)
+    stream_log(stream, [LOG[:50], LOG[50:]])
+    stream.close()
+
+    assert output.content == LOG.decode('utf-8')
+    assert stream.offset == len(LOG)
+
+
+def test_job_log_stream_resume_skips_received_bytes():
+    output = FakeOutput()
+    stream = JobLogStream(output)
+    stream_log(stream, [LOG[:30], LOG[30:77]])
+    # The new connection replays the log from the start, with different chunk boundaries
+    stream_log(stream, [LOG[:50], LOG[50:100], LOG[100:]])
+    stream.close()
+
+    assert output.content == LOG.decode('utf-8')
+    assert stream.offset == len(LOG)
+
+
+def test_job_log_stream_since_with_partial_lines():
+    output = FakeOutput()
+    stream = JobLogStream(output, since=datetime(2018, 1, 1, 10, 7, tzinfo=pytz.UTC))
+    stream_log(stream, [LOG[i:i + 7] for i in range(0, len(LOG), 7)])
+    stream.close()
+
+    assert output.content == LOG[LOG.index(b'\x1b[32m2018/01/01 10:07'):].decode('utf-8')
+
+
+def test_job_log_stream_tail_of_existing_log_then_follow():
+    output = FakeOutput()
+    stream = JobLogStream(output, tail=3, attached_at=datetime(2018, 1, 1, 10, 6, tzinfo=pytz.UTC))
+    live_start = LOG.index(b'\x1b[32m2018/01/01 10:06')
+    existing, live = LOG[:live_start], LOG[live_start:]
+    # The existing log may come in several messages
+    stream_log(stream, [existing[i:i + 7] for i in range(0, len(existing), 7)])
+    assert output.content == ''
+
+    stream.feed(live[:60])
+    existing_lines = existing.splitlines(keepends=True)
+    assert output.content.startswith(b''.join(existing_lines[-3:]).decode('utf-8'))
+
+    stream.feed(live[60:])
+    stream.close()
+    assert output.content == (b''.join(existing_lines[-3:]) + live).decode('utf-8')
+
+
+def test_job_log_stream_tail_of_finished_job():
+    output = FakeOutput()
+    stream = JobLogStream(output, tail=2, attached_at=datetime(2018, 1, 2, tzinfo=pytz.UTC))
+    stream_log(stream, [LOG[:100], LOG[100:]])
+    assert output.content == ''
+
+    stream.close()
+    assert output.content == b''.join(LOG.splitlines(keepends=True)[-2:]).decode('utf-8')
+
+
+class FakeJobsApi:
+    def __init__(self, jobs, page_limit):
+        self.jobs = jobs
+        self.page_limit = page_limit
+        self.pages = []
+
+    def list(self, nb, page, **filters):
+        self.pages.append(page)
+        max_results = min(nb, self.page_limit)
+        return self.jobs[(page - 1) * max_results:page * max_results], max_results, len(self.jobs), page
+
+
+def test_iter_jobs_with_server_page_limit():
+    context = Mock(jobs=FakeJobsApi([{'_id': str(i)} for i in range(150)], page_limit=50))
+
+    assert [job['_id'] for job in iter_jobs(context, nb=100)] == [str(i) for i in range(150)]
+    assert context.jobs.pages == [1, 2, 3]
+
+
+def drop_then_stream(job_id, success_handler, exception_handler, **kwargs):
+    if not drop_then_stream.dropped:
+        drop_then_stream.dropped = True
+        exception_handler(Exception('connection lost'))
+    success_handler(LOG)
+
+
+def test_job_log_handler_resumes_while_waiting_for_start(monkeypatch):
+    monkeypatch.setattr(jobs_cli, 'LOG_RECONNECT_DELAY', 0)
+    drop_then_stream.dropped = False
+    context = Mock()
+    context.jobs.get_logs_async.side_effect = drop_then_stream
+    output = FakeOutput()
+
+    jobs_cli.job_log_handler(context, 'job', output, False, True)
+    assert context.jobs.get_logs_async.call_count == 2
+    assert output.content == LOG.decode('utf-8')
+
+
+def test_job_log_handler_fails_if_nothing_received_without_waiting():
+    drop_then_stream.dropped = False
+    context = Mock()
+    context.jobs.get_logs_async.side_effect = drop_then_stream
+
+    with pytest.raises(ClickException):
+        jobs_cli.job_log_handler(context, 'job', None, False, False)
+    assert context.jobs.get_logs_async.call_count == 1
+
+
+def test_job_log_handler_does_not_retry_api_errors():
+    context = Mock()
+    context.jobs.get_logs_async.side_effect = ApiClientException('404 job not found')
+
+    with pytest.raises(ClickException):
+        jobs_cli.job_log_handler(context, 'job', None, False, True)
+    assert context.jobs.get_logs_async.call_count == 1
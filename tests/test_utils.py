@@ -0,0 +1,53 @@
+import math
+import random
+
+from casper.utils import StreamingQuantile, parse_log_line_date, parse_rfc1123_date
+
+
+def nearest_rank(values, quantile):
+    values = sorted(values)
+    return values[max(math.ceil(quantile * len(values)) - 1, 0)]
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def sketch_of(values, **kwargs):
+    sketch = StreamingQuantile(QUANTILES, **kwargs)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_streaming_quantile_empty():
+    assert StreamingQuantile(QUANTILES).value(0.5) is None
+
+
+def test_streaming_quantile_nearest_rank():
+    assert sketch_of([2, 1]).value(0.5) == 1
+    assert sketch_of([4, 3, 2, 1]).value(0.5) == 2
+    assert sketch_of([4, 3, 2, 1]).value(0.99) == 4
+    assert sketch_of([42]).value(0.95) == 42
+
+
+def test_streaming_quantile_exact_for_small_samples():
+    rand = random.Random(42)
+    for size in (6, 8, 10, 20, 50, 500):
+        values = [rand.lognormvariate(5, 1) for _ in range(size)]
+        sketch = sketch_of(values)
+        for quantile in QUANTILES:
+            assert sketch.value(quantile) == nearest_rank(values, quantile)
+
+
+def test_streaming_quantile_estimate_for_large_samples():
+    rand = random.Random(42)
+    values = [rand.lognormvariate(5, 1) for _ in range(20000)]
+    sketch = sketch_of(values, exact_size=100)
+    assert sketch.count == len(values)
+    for quantile in QUANTILES:
+        assert abs(sketch.value(quantile) / nearest_rank(values, quantile) - 1) < 0.05
+
+
+def test_parse_dates():
+    assert parse_rfc1123_date('Mon, 01 Jan 2018 10:00:00 GMT').isoformat() == '2018-01-01T10:00:00+00:00'
+    assert parse_log_line_date(b'2018/01/01 10:00:00').isoformat() == '2018-01-01T10:00:00+00:00'